@@ -4,25 +4,32 @@ The federated averaging algorithm for PyTorch.
 
 from collections import OrderedDict
 
+import torch
+
 from plato.algorithms import base
 
 
+# pylint: disable=protected-access
 class Algorithm(base.Algorithm):
     """PyTorch-based federated averaging algorithm, used by both the client and the server."""
 
     def compute_weight_deltas(self, baseline_weights, weights_received):
         """Compute the deltas between baseline weights and weights received."""
+        baseline_names = list(baseline_weights.keys())
+        baselines = list(baseline_weights.values())
+
         # Calculate updates from the received weights
         deltas = []
         for weight in weights_received:
-            delta = OrderedDict()
-            for name, current_weight in weight.items():
-                baseline = baseline_weights[name]
+            names = list(weight.keys())
+            if names == baseline_names:
+                current_baselines = baselines
+            else:
+                current_baselines = [baseline_weights[name] for name in names]
 
-                # Calculate update
-                _delta = current_weight - baseline
-                delta[name] = _delta
-            deltas.append(delta)
+            # Calculate all updates of this client in one multi-tensor operation
+            _deltas = torch._foreach_sub(list(weight.values()), current_baselines)
+            deltas.append(OrderedDict(zip(names, _deltas)))
 
         return deltas
 
@@ -30,11 +37,14 @@ class Algorithm(base.Algorithm):
         """Updates the existing model weights from the provided deltas."""
         baseline_weights = self.extract_weights()
 
-        updated_weights = OrderedDict()
-        for name, weight in baseline_weights.items():
-            updated_weights[name] = weight + deltas[name]
+        # Apply all deltas to a single traversal of the baseline weights in one
+        # multi-tensor operation
+        names = list(baseline_weights.keys())
+        updated_values = torch._foreach_add(
+            list(baseline_weights.values()), [deltas[name] for name in names]
+        )
 
-        return updated_weights
+        return OrderedDict(zip(names, updated_values))
 
     def extract_weights(self, model=None):
         """Extracts weights from the model."""
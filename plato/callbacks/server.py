@@ -4,6 +4,7 @@ when creating new server callbacks.
 
 Defines a default callback to print training progress.
 """
+import csv
 import logging
 import os
 from abc import ABC
@@ -62,14 +63,19 @@ class LogProgressCallback(ServerCallback):
         self.recorded_items = [x.strip() for x in recorded_items.split(",")]
 
         # Initialize the .csv file for logging runtime results
-        result_csv_file = f"{Config().params['result_path']}/{os.getpid()}.csv"
+        self.result_csv_file = f"{Config().params['result_path']}/{os.getpid()}.csv"
         csv_processor.initialize_csv(
-            result_csv_file, self.recorded_items, Config().params["result_path"]
+            self.result_csv_file, self.recorded_items, Config().params["result_path"]
         )
 
+        # The .csv file is opened when the first results are recorded, and kept
+        # open until the server closes, rather than reopened in every round
+        self.result_file = None
+        self.result_writer = None
+
         logging.info(
             fonts.colourize(
-                f"[{os.getpid()}] Logging runtime results to: {result_csv_file}."
+                f"[{os.getpid()}] Logging runtime results to: {self.result_csv_file}."
             )
         )
 
@@ -92,14 +98,18 @@ class LogProgressCallback(ServerCallback):
 
     def on_clients_processed(self, server, **kwargs):
         """Additional work to be performed after client reports have been processed."""
-        # Record results into a .csv file
-        new_row = []
-        for item in self.recorded_items:
-            item_value = server.get_logged_items()[item]
-            new_row.append(item_value)
+        # Record results into a .csv file, collecting all logged items at once
+        logged_items = server.get_logged_items()
+        new_row = [logged_items[item] for item in self.recorded_items]
+
+        if self.result_file is None:
+            # pylint: disable=consider-using-with
+            self.result_file = open(self.result_csv_file, "a", encoding="utf-8")
+            self.result_writer = csv.writer(self.result_file)
 
-        result_csv_file = f"{Config().params['result_path']}/{os.getpid()}.csv"
-        csv_processor.write_csv(result_csv_file, new_row)
+        self.result_writer.writerow(new_row)
+        # The server exits with os._exit(), so rows are flushed as they are written
+        self.result_file.flush()
 
         if (
             hasattr(Config().clients, "do_test")
@@ -136,3 +146,8 @@ class LogProgressCallback(ServerCallback):
         Event called at the start of closing the server.
         """
         logging.info("[%s] Closing the server.", server)
+
+        if self.result_file is not None:
+            self.result_file.close()
+            self.result_file = None
+            self.result_writer = None
@@ -5,8 +5,10 @@ A simple federated learning server using federated averaging.
 import asyncio
 import logging
 import os
-import numpy as np
 import math
+import sys
+
+import numpy as np
 
 from plato.algorithms import registry as algorithms_registry
 from plato.config import Config
@@ -18,7 +20,19 @@ from plato.trainers import registry as trainers_registry
 from plato.utils import csv_processor, fonts
 
 
+def _is_torch_tensors(tensors) -> bool:
+    """Whether all the tensors are PyTorch tensors.
+
+    This server is also used with other frameworks, so PyTorch is not imported
+    here; tensors can only be PyTorch tensors if it has been imported elsewhere.
+    """
+    torch = sys.modules.get("torch")
+    return torch is not None and all(
+        isinstance(tensor, torch.Tensor) for tensor in tensors
+    )
+
 
+# pylint: disable=protected-access
 class Server(base.Server):
     """Federated learning server using federated averaging."""
 
@@ -43,12 +57,29 @@ class Server(base.Server):
         self.testset_sampler = None
         self.total_samples = 0
 
+        # The [clients, N] buffer of flattened client deltas, reused across rounds
+        self._flat_deltas = None
+
+        self._pid = os.getpid()
+
         self.total_clients = Config().clients.total_clients
         self.clients_per_round = Config().clients.per_round
 
+        # Round-invariant constants of the bound used to stop training early
+        n, mu, bar_rho = 0.04, 0.3, 1
+        L, C, D, A1 = 1.0, 0.2, 0.1, 18
+        self._lambda = 1 - n * mu * (1 + (3 * bar_rho) / 8)
+        self._x = (4 * L * (n * C + D)) / (mu * (8 + 3 * bar_rho))
+        self._denominator = (L / mu) * A1 - 1
+
+        # The base of the logarithm is constant, so its validity and inverse
+        # logarithm are computed once as well
+        self._valid_base = self._denominator > 0 and 0 < self._lambda != 1
+        self._inv_log_lambda = 1 / math.log(self._lambda) if self._valid_base else 0
+
         logging.info(
             "[Server #%d] Started training on %d clients with %d per round.",
-            os.getpid(),
+            self._pid,
             self.total_clients,
             self.clients_per_round,
         )
@@ -140,32 +171,88 @@ class Server(base.Server):
     async def aggregate_deltas(self, updates, deltas_received):
         """Aggregate weight updates from the clients using federated averaging."""
         # Extract the total number of samples
-        self.total_samples = sum(update.report.num_samples for update in updates)
+        sample_counts = [update.report.num_samples for update in updates]
+        self.total_samples = sum(sample_counts)
+
+        # Yield to other tasks in the server before aggregating. The flattened
+        # buffer below is shared across calls, so it must be filled and read
+        # without yielding in between
+        await asyncio.sleep(0)
+
+        if not _is_torch_tensors(deltas_received[0].values()):
+            # Deltas from other frameworks are averaged one parameter at a time
+            avg_update = {
+                name: self.trainer.zeros(delta.shape)
+                for name, delta in deltas_received[0].items()
+            }
+
+            for num_samples, update in zip(sample_counts, deltas_received):
+                for name, delta in update.items():
+                    # Use weighted average by the number of samples
+                    avg_update[name] += delta * (num_samples / self.total_samples)
+
+            return avg_update
+
+        # pylint: disable=import-outside-toplevel
+        import torch
+
+        # Flatten the deltas from each client into one row of a [clients, N] matrix,
+        # so that the weighted average is computed as a single matrix-vector product
+        names = list(deltas_received[0].keys())
+        shapes = [delta.shape for delta in deltas_received[0].values()]
+        sizes = [delta.numel() for delta in deltas_received[0].values()]
+
+        num_clients = len(deltas_received)
+        total_size = sum(sizes)
+        if (
+            self._flat_deltas is None
+            or self._flat_deltas.shape[0] < num_clients
+            or self._flat_deltas.shape[1] != total_size
+        ):
+            self._flat_deltas = torch.empty(
+                (max(num_clients, self.clients_per_round), total_size)
+            )
+
+        flat_deltas = self._flat_deltas[:num_clients]
+
+        # Subclasses may pass deltas that require gradients, which cannot be
+        # copied into the buffer with out= while autograd is recording
+        with torch.no_grad():
+            for row, update in zip(flat_deltas, deltas_received):
+                # Clients training the same model return their deltas in the same
+                # order, so the values can be read positionally without key lookups
+                if list(update) == names:
+                    deltas = update.values()
+                else:
+                    deltas = [update[name] for name in names]
+                torch.cat([delta.reshape(-1) for delta in deltas], out=row)
+
+        if len(set(sample_counts)) == 1:
+            # All clients carry the same weight, so the average is a plain mean
+            avg_flat = flat_deltas.mean(dim=0)
+        else:
+            # Perform weighted averaging
+            sample_weights = (
+                torch.tensor(sample_counts, dtype=flat_deltas.dtype)
+                / self.total_samples
+            )
+            avg_flat = sample_weights @ flat_deltas
 
-        # Perform weighted averaging
         avg_update = {
-            name: self.trainer.zeros(delta.shape)
-            for name, delta in deltas_received[0].items()
+            name: delta.view(shape)
+            for name, shape, delta in zip(names, shapes, torch.split(avg_flat, sizes))
         }
 
-        for i, update in enumerate(deltas_received):
-            report = updates[i].report
-            num_samples = report.num_samples
-
-            for name, delta in update.items():
-                # Use weighted average by the number of samples
-                avg_update[name] += delta * (num_samples / self.total_samples)
-
-            # Yield to other tasks in the server
-            await asyncio.sleep(0)
-
         return avg_update
 
     async def _process_reports(self):
         """Process the client reports by aggregating their weights."""
         weights_received = [update.payload for update in self.updates]
 
-        weights_received = self.weights_received(weights_received)
+        # The default hook returns the weights unchanged, so it is only called
+        # when a subclass overrides it
+        if type(self).weights_received is not Server.weights_received:
+            weights_received = self.weights_received(weights_received)
         self.callback_handler.call_event("on_weights_received", self, weights_received)
 
         # Extract the current model weights as the baseline
@@ -175,7 +262,7 @@ class Server(base.Server):
             # Runs a server aggregation algorithm using weights rather than deltas
             logging.info(
                 "[Server #%d] Aggregating model weights directly rather than weight deltas.",
-                os.getpid(),
+                self._pid,
             )
             updated_weights = await self.aggregate_weights(
                 self.updates, baseline_weights, weights_received
@@ -191,7 +278,7 @@ class Server(base.Server):
             )
             # Runs a framework-agnostic server aggregation algorithm, such as
             # the federated averaging algorithm
-            logging.info("[Server #%d] Aggregating model weight deltas.", os.getpid())
+            logging.info("[Server #%d] Aggregating model weight deltas.", self._pid)
             deltas = await self.aggregate_deltas(self.updates, deltas_received)
 
 
@@ -210,53 +297,36 @@ class Server(base.Server):
         # The model weights have already been aggregated, now calls the
         # corresponding hook and callback
 
-        # updated_weights is likely an OrderedDict of parameter_name -> tensor
-        # Convert each parameter tensor to numpy and stack them into a 2D array.
-        # For example, if we consider each parameter flattened as a column vector:
-        param_arrays = [param.detach().cpu().numpy().flatten() for param in updated_weights.values()]
-
-        all_s_values = []
-        for p_arr in param_arrays:
-            p_arr_2d = p_arr.reshape(-1, 1)
-            U, S, Vt = np.linalg.svd(p_arr_2d, full_matrices=False)
-            all_s_values.extend(S)
-
-        # Compute the global average of all singular values
-        s_average = np.mean(all_s_values)
-
-        # Define constants
-        n = 0.04  # Example value for n
-        mu = 0.5  # Example value for mu
-        bar_rho = 1  # Example value for bar_rho
-
-        # Calculate lambda_value
-        lambda_value = 1 - n * mu * (1 + (3 * bar_rho) / 8)
-
-        # Define the rest of the constants
-        L = 1.0  # Example value for L
-        C = 0.2  # Example value for C
-        D = 0.1  # Example value for D
-        mu = 0.3  # Example value for mu (redefining mu if intended)
-
-        # Recalculate lambda_value if mu changed
-        lambda_value = 1 - n * mu * (1 + (3 * bar_rho) / 8)
-
-        # Calculate x
-        x = (4 * L * (n * C + D)) / (mu * (8 + 3 * bar_rho))
-
-        # delta_g is just s_average now
-        delta_g = s_average
-
-        A1 = 18
-
-        # Calculate numerator and denominator
-        numerator = delta_g - x
-        denominator = (L / mu) * A1 - 1
+        # The only singular value of a parameter flattened into a column vector
+        # is its L2 norm, so the global average of all singular values is the
+        # mean of the per-parameter norms. All norms are computed by one fused
+        # multi-tensor kernel, with a single synchronization at the end
+        if _is_torch_tensors(updated_weights.values()):
+            # pylint: disable=import-outside-toplevel
+            import torch
+
+            with torch.no_grad():
+                params = [
+                    param if param.is_floating_point() else param.float()
+                    for param in updated_weights.values()
+                ]
+                norms = torch._foreach_norm(params)
+                s_average = torch.stack(norms).mean().item()
+        else:
+            s_average = float(
+                np.mean(
+                    [
+                        np.linalg.norm(np.asarray(param, dtype=np.float64))
+                        for param in updated_weights.values()
+                    ]
+                )
+            )
 
         # Check conditions for the logarithm
-        if numerator > 0 and denominator > 0 and lambda_value > 0 and lambda_value != 1:
-            argument = numerator / denominator
-            t = math.log(argument, lambda_value)
+        numerator = s_average - self._x
+        if self._valid_base and numerator > 0:
+            argument = numerator / self._denominator
+            t = math.log(argument) * self._inv_log_lambda
             print(f"The value of t is: {t}")
         else:
             print("Invalid inputs: Logarithm arguments must be positive and lambda_value should be a valid base.")
@@ -305,39 +375,47 @@ class Server(base.Server):
 
     def get_logged_items(self) -> dict:
         """Get items to be logged by the LogProgressCallback class in a .csv file."""
+        # Find the slowest processing, communication and round times in one pass
+        processing_time = comm_time = round_time = 0.0
+        for update in self.updates:
+            report = update.report
+            processing_time = max(processing_time, report.processing_time)
+            comm_time = max(comm_time, report.comm_time)
+            round_time = max(
+                round_time,
+                report.training_time + report.processing_time + report.comm_time,
+            )
+
         return {
             "round": self.current_round,
             "accuracy": self.accuracy,
             "accuracy_std": self.accuracy_std,
             "elapsed_time": self.wall_time - self.initial_wall_time,
-            "processing_time": max(
-                update.report.processing_time for update in self.updates
-            ),
-            "comm_time": max(update.report.comm_time for update in self.updates),
-            "round_time": max(
-                update.report.training_time
-                + update.report.processing_time
-                + update.report.comm_time
-                for update in self.updates
-            ),
+            "processing_time": processing_time,
+            "comm_time": comm_time,
+            "round_time": round_time,
             "comm_overhead": self.comm_overhead,
         }
 
     @staticmethod
     def get_accuracy_mean_std(updates):
         """Compute the accuracy mean and standard deviation across clients."""
-        # Get total number of samples
-        total_samples = sum(update.report.num_samples for update in updates)
+        accuracies = np.fromiter(
+            (update.report.accuracy for update in updates),
+            dtype=np.float64,
+            count=len(updates),
+        )
+        num_samples = np.fromiter(
+            (update.report.num_samples for update in updates),
+            dtype=np.float64,
+            count=len(updates),
+        )
 
         # Perform weighted averaging
-        updates_accuracy = [update.report.accuracy for update in updates]
-        weights = [update.report.num_samples / total_samples for update in updates]
+        weights = num_samples / num_samples.sum()
 
-        mean = sum(acc * weights[idx] for idx, acc in enumerate(updates_accuracy))
-        variance = sum(
-            (acc - mean) ** 2 * weights[idx] for idx, acc in enumerate(updates_accuracy)
-        )
-        std = variance**0.5
+        mean = float(accuracies @ weights)
+        std = float(np.sqrt(((accuracies - mean) ** 2) @ weights))
 
         return mean, std
 
@@ -35,9 +35,6 @@ class Trainer(ABC):
         model_path = Config().params["model_path"]
         model_name = Config().trainer.model_name
 
-        if not os.path.exists(model_path):
-            os.makedirs(model_path)
-
         if filename is not None:
             accuracy_path = f"{model_path}/{filename}"
         else:
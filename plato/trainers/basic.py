@@ -3,8 +3,11 @@ The training and testing loops for PyTorch.
 """
 
 import copy
+import inspect
+import io
 import logging
 import multiprocessing as mp
+from multiprocessing import connection
 import os
 import pickle
 import re
@@ -17,6 +20,18 @@ from plato.config import Config
 from plato.models import registry as models_registry
 from plato.trainers import base, loss_criterion, lr_schedulers, optimizers, tracking
 
+# Whether torch.load() can memory-map checkpoints, supported since PyTorch 2.1
+TORCH_LOAD_MMAP = "mmap" in inspect.signature(torch.load).parameters
+
+
+def get_grad_scaler(enabled: bool):
+    """Returns a gradient scaler for mixed precision training on a GPU."""
+    if hasattr(torch.amp, "GradScaler"):
+        return torch.amp.GradScaler("cuda", enabled=enabled)
+
+    # PyTorch versions before 2.3 only provide the deprecated CUDA gradient scaler
+    return torch.cuda.amp.GradScaler(enabled=enabled)
+
 
 class Trainer(base.Trainer):
     """A basic federated learning trainer, used by both the client and the server."""
@@ -54,8 +69,30 @@ class Trainer(base.Trainer):
         self._loss_criterion = None
         self.optimizer = None
         self.lr_scheduler = None
+        self.grad_scaler = get_grad_scaler(enabled=False)
+        self.model_compiled = False
         self.current_epoch = 0
 
+        # The number of worker processes loading data in the background
+        self.num_workers = (
+            Config().trainer.num_workers
+            if hasattr(Config().trainer, "num_workers")
+            else 0
+        )
+
+        # The sending end of a pipe for results from a spawned training or testing
+        # process
+        self.result_sender = None
+
+        # Whether the last spawned process sent its result back in memory, so that
+        # there are no result files to be removed
+        self.result_received = False
+
+    @property
+    def uses_cuda(self) -> bool:
+        """Whether the model is trained and tested on a CUDA device."""
+        return torch.cuda.is_available() and "cuda" in str(self.device)
+
     def zeros(self, shape):
         """Returns a PyTorch zero tensor with the given shape."""
         # This should only be called from a server
@@ -67,11 +104,9 @@ class Trainer(base.Trainer):
         model_path = Config().params["model_path"] if location is None else location
         model_name = Config().trainer.model_name
 
-        try:
-            if not os.path.exists(model_path):
-                os.makedirs(model_path)
-        except FileExistsError:
-            pass
+        # The default model path is created when the configuration is loaded
+        if location is not None:
+            os.makedirs(model_path, exist_ok=True)
 
         if filename is not None:
             model_path = f"{model_path}/{filename}"
@@ -110,16 +145,33 @@ class Trainer(base.Trainer):
                 "[Client #%d] Loading a model from %s.", self.client_id, model_path
             )
 
-        pretrained = None
-        if torch.cuda.is_available():
-            pretrained = torch.load(model_path)
-        else:
-            pretrained = torch.load(model_path, map_location=torch.device("cpu"))
+        pretrained = self.load_state_dict_file(model_path)
         self.model.load_state_dict(pretrained, strict=True)
 
         with open(model_path + ".pkl", "rb") as history_file:
             self.run_history = pickle.load(history_file)
 
+    @staticmethod
+    def load_state_dict_file(model_path):
+        """Loads a state dict saved by torch.save() from a file.
+
+        The tensors are loaded onto the CPU, and the file is memory-mapped where
+        supported (PyTorch 2.1 or newer, and checkpoints in the zipfile format)
+        rather than read into memory, since load_state_dict() copies them into
+        the model's parameters anyway.
+        """
+        if TORCH_LOAD_MMAP:
+            try:
+                return torch.load(
+                    model_path, map_location=torch.device("cpu"), mmap=True
+                )
+            except RuntimeError:
+                # Checkpoints saved in the legacy (non-zipfile) format, such as
+                # some pretrained models, cannot be memory-mapped
+                pass
+
+        return torch.load(model_path, map_location=torch.device("cpu"))
+
     def simulate_sleep_time(self):
         """Simulate client's speed by putting it to sleep."""
         if not (
@@ -137,6 +189,40 @@ class Trainer(base.Trainer):
             time.sleep(sleep_seconds)
             logging.info("[Client #%d] Woke up.", self.client_id)
 
+    def setup_cuda_backends(self, config):
+        """Configures cuDNN and TensorFloat-32 for training and testing on a GPU.
+
+        Arguments:
+        config: a dictionary of configuration parameters.
+        """
+        if not self.uses_cuda:
+            return
+
+        # Let cuDNN benchmark and pick the fastest algorithms for the input shapes
+        torch.backends.cudnn.benchmark = (
+            config["cudnn_benchmark"] if "cudnn_benchmark" in config else True
+        )
+
+        if "tf32" in config and config["tf32"]:
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+
+    def compile_model(self, config):
+        """Compiles the model in place with torch.compile(), if requested.
+
+        Arguments:
+        config: a dictionary of configuration parameters.
+        """
+        if (
+            "compile" in config
+            and config["compile"]
+            and not self.model_compiled
+            and hasattr(self.model, "compile")
+        ):
+            # Compiling in place keeps the names in the model's state dict intact
+            self.model.compile()
+            self.model_compiled = True
+
     def train_process(self, config, trainset, sampler, **kwargs):
         """
         The main training loop in a federated learning workload, run in a
@@ -150,6 +236,8 @@ class Trainer(base.Trainer):
         sampler: The sampler that extracts a partition for this client.
         kwargs (optional): Additional keyword arguments.
         """
+        self.setup_cuda_backends(config)
+
         try:
             self.train_model(config, trainset, sampler.get(), **kwargs)
         except Exception as training_exception:
@@ -157,10 +245,23 @@ class Trainer(base.Trainer):
             raise training_exception
 
         if "max_concurrency" in config:
-            self.model.cpu()
-            model_name = config["model_name"]
-            filename = f"{model_name}_{self.client_id}_{config['run_id']}.pth"
-            self.save_model(filename)
+            # The model is not moved back to the CPU first, since this process
+            # exits right after; the parent loads the weights onto the CPU
+            if self.result_sender is None:
+                model_name = config["model_name"]
+                filename = f"{model_name}_{self.client_id}_{config['run_id']}.pth"
+                self.save_model(filename)
+            else:
+                # Send the trained model back to the parent process in memory,
+                # rather than round-tripping it through a file
+                if self.model_state_dict is None:
+                    model_state_dict = self.model.state_dict()
+                else:
+                    model_state_dict = self.model_state_dict
+
+                buffer = io.BytesIO()
+                torch.save(model_state_dict, buffer)
+                self.result_sender.send((buffer.getvalue(), self.run_history))
 
     def perform_forward_and_backward_passes(self, config, examples, labels):
         """Perform forward and backward passes in the training loop.
@@ -172,19 +273,24 @@ class Trainer(base.Trainer):
 
         Returns: loss values after the current batch has been processed.
         """
-        self.optimizer.zero_grad()
+        self.optimizer.zero_grad(set_to_none=True)
 
-        outputs = self.model(examples)
+        with torch.autocast("cuda", enabled=self.grad_scaler.is_enabled()):
+            outputs = self.model(examples)
 
-        loss = self._loss_criterion(outputs, labels)
-        self._loss_tracker.update(loss, labels.size(0))
+            loss = self._loss_criterion(outputs, labels)
+        # Track a detached loss, so that the running total accumulated on the
+        # device does not keep extending the autograd graph across steps
+        self._loss_tracker.update(loss.detach(), labels.size(0))
 
+        # The gradient scaler is a pass-through when mixed precision is disabled
         if "create_graph" in config:
-            loss.backward(create_graph=config["create_graph"])
+            self.grad_scaler.scale(loss).backward(create_graph=config["create_graph"])
         else:
-            loss.backward()
+            self.grad_scaler.scale(loss).backward()
 
-        self.optimizer.step()
+        self.grad_scaler.step(self.optimizer)
+        self.grad_scaler.update()
 
         return loss
 
@@ -210,11 +316,28 @@ class Trainer(base.Trainer):
         self.lr_scheduler = self.get_lr_scheduler(config, self.optimizer)
         self.optimizer = self._adjust_lr(config, self.lr_scheduler, self.optimizer)
 
+        # Initializing the gradient scaler for mixed precision training
+        self.grad_scaler = get_grad_scaler(
+            enabled="amp" in config and config["amp"] and self.uses_cuda
+        )
+
         self.model.to(self.device)
+        self.compile_model(config)
         self.model.train()
 
         total_epochs = config["epochs"]
 
+        # Look up the per-epoch settings once, rather than in every epoch
+        speed_simulation = (
+            self.client_id != 0
+            and hasattr(Config().clients, "speed_simulation")
+            and Config().clients.speed_simulation
+        )
+        request_update = (
+            hasattr(Config().server, "request_update")
+            and Config().server.request_update
+        )
+
         for self.current_epoch in range(1, total_epochs + 1):
             self._loss_tracker.reset()
             self.train_epoch_start(config)
@@ -226,7 +349,8 @@ class Trainer(base.Trainer):
                     "on_train_step_start", self, config, batch=batch_id
                 )
 
-                examples, labels = examples.to(self.device), labels.to(self.device)
+                examples = examples.to(self.device, non_blocking=True)
+                labels = labels.to(self.device, non_blocking=True)
 
                 loss = self.perform_forward_and_backward_passes(
                     config, examples, labels
@@ -243,25 +367,16 @@ class Trainer(base.Trainer):
                 self.optimizer.params_state_update()
 
             # Simulate client's speed
-            if (
-                self.client_id != 0
-                and hasattr(Config().clients, "speed_simulation")
-                and Config().clients.speed_simulation
-            ):
+            if speed_simulation:
                 self.simulate_sleep_time()
 
             # Saving the model at the end of this epoch to a file so that
             # it can later be retrieved to respond to server requests
             # in asynchronous mode when the wall clock time is simulated
-            if (
-                hasattr(Config().server, "request_update")
-                and Config().server.request_update
-            ):
-                self.model.cpu()
+            if request_update:
                 training_time = time.perf_counter() - tic
                 filename = f"{self.client_id}_{self.current_epoch}_{training_time}.pth"
                 self.save_model(filename)
-                self.model.to(self.device)
 
             self.run_history.update_metric("train_loss", self._loss_tracker.average)
             self.train_epoch_end(config)
@@ -290,26 +405,32 @@ class Trainer(base.Trainer):
         if "max_concurrency" in config:
             tic = time.perf_counter()
 
-            if mp.get_start_method(allow_none=True) != "spawn":
-                mp.set_start_method("spawn", force=True)
-
-            train_proc = mp.Process(
-                target=self.train_process,
-                args=(config, trainset, sampler),
-                kwargs=kwargs,
+            result = self.run_process(
+                self.train_process, (config, trainset, sampler), kwargs
             )
-            train_proc.start()
-            train_proc.join()
 
-            model_name = Config().trainer.model_name
-            filename = f"{model_name}_{self.client_id}_{Config().params['run_id']}.pth"
+            if result is not None:
+                self.result_received = True
+                model_state_dict, self.run_history = result
+                self.model.load_state_dict(
+                    torch.load(
+                        io.BytesIO(model_state_dict), map_location=torch.device("cpu")
+                    ),
+                    strict=True,
+                )
+            else:
+                # Custom training processes may still save the model to a file
+                model_name = Config().trainer.model_name
+                filename = (
+                    f"{model_name}_{self.client_id}_{Config().params['run_id']}.pth"
+                )
 
-            try:
-                self.load_model(filename)
-            except OSError as error:  # the model file is not found, training failed
-                raise ValueError(
-                    f"Training on client {self.client_id} failed."
-                ) from error
+                try:
+                    self.load_model(filename)
+                except OSError as error:  # the model file is not found, training failed
+                    raise ValueError(
+                        f"Training on client {self.client_id} failed."
+                    ) from error
 
             toc = time.perf_counter()
             self.pause_training()
@@ -322,6 +443,71 @@ class Trainer(base.Trainer):
 
         return training_time
 
+    def pause_training(self):
+        """Remove files of running trainers, unless results were received in memory."""
+        # Custom train() or test() methods that load results from files do not
+        # set the flag, so their files are still removed
+        if not self.result_received:
+            super().pause_training()
+
+        self.result_received = False
+
+    def run_process(self, target, args, kwargs):
+        """Runs a training or testing loop in a spawned process, with a new CUDA
+        context, and receives the result it sends back.
+
+        Arguments:
+        target: the training or testing loop to run.
+        args: the positional arguments of the loop.
+        kwargs: the keyword arguments of the loop.
+
+        Returns: the result, or None if the process exited without sending one.
+        """
+        if mp.get_start_method(allow_none=True) != "spawn":
+            mp.set_start_method("spawn", force=True)
+
+        receiver, self.result_sender = mp.Pipe(duplex=False)
+        try:
+            proc = mp.Process(target=target, args=args, kwargs=kwargs)
+            proc.start()
+
+            # The spawned process has its own copy of the sending end
+            self.result_sender.close()
+            self.result_sender = None
+
+            result = self.receive_result(receiver, proc)
+            proc.join()
+        finally:
+            self.result_sender = None
+            receiver.close()
+
+        return result
+
+    @staticmethod
+    def receive_result(receiver, proc):
+        """Receives the result sent by a spawned training or testing process.
+
+        Arguments:
+        receiver: the receiving end of the pipe that the result is sent through.
+        proc: the spawned process.
+
+        Returns: the result, or None if the process exited without sending one.
+        """
+        # The result is received before the process is joined, since a process
+        # sending a large result blocks until it has been read. Waiting on the
+        # process sentinel as well returns as soon as a process exits without
+        # sending anything, such as when it saved its result to a file instead
+        connection.wait([receiver, proc.sentinel])
+
+        if not receiver.poll():
+            return None
+
+        try:
+            return receiver.recv()
+        except EOFError:
+            # The process exited while sending its result
+            return None
+
     def test_process(self, config, testset, sampler=None, **kwargs):
         """The testing loop, run in a separate process with a new CUDA context,
         so that CUDA memory can be released after the training completes.
@@ -332,7 +518,10 @@ class Trainer(base.Trainer):
         sampler: The sampler that extracts a partition of the test dataset.
         kwargs (optional): Additional keyword arguments.
         """
+        self.setup_cuda_backends(config)
+
         self.model.to(self.device)
+        self.compile_model(config)
         self.model.eval()
 
         # Initialize accuracy to be returned to -1, so that the client can disconnect
@@ -349,12 +538,15 @@ class Trainer(base.Trainer):
             logging.info("Testing on client #%d failed.", self.client_id)
             raise testing_exception
 
-        self.model.cpu()
-
         if "max_concurrency" in config:
-            model_name = config["model_name"]
-            filename = f"{model_name}_{self.client_id}_{config['run_id']}.acc"
-            self.save_accuracy(accuracy, filename)
+            if self.result_sender is None:
+                model_name = config["model_name"]
+                filename = f"{model_name}_{self.client_id}_{config['run_id']}.acc"
+                self.save_accuracy(accuracy, filename)
+            else:
+                # Send the accuracy back to the parent process in memory, rather
+                # than round-tripping it through a file
+                self.result_sender.send(accuracy)
         else:
             return accuracy
 
@@ -370,26 +562,25 @@ class Trainer(base.Trainer):
         config["run_id"] = Config().params["run_id"]
 
         if hasattr(Config().trainer, "max_concurrency"):
-            if mp.get_start_method(allow_none=True) != "spawn":
-                mp.set_start_method("spawn", force=True)
-
-            proc = mp.Process(
-                target=self.test_process, args=(config, testset, sampler), kwargs=kwargs
+            accuracy = self.run_process(
+                self.test_process, (config, testset, sampler), kwargs
             )
-            proc.start()
-            proc.join()
 
-            accuracy = -1
-            try:
+            if accuracy is not None:
+                self.result_received = True
+            else:
+                # Custom testing processes may still save the accuracy to a file
                 model_name = Config().trainer.model_name
                 filename = (
                     f"{model_name}_{self.client_id}_{Config().params['run_id']}.acc"
                 )
-                accuracy = self.load_accuracy(filename)
-            except OSError as error:  # the model file is not found, training failed
-                raise ValueError(
-                    f"Testing on client #{self.client_id} failed."
-                ) from error
+
+                try:
+                    accuracy = self.load_accuracy(filename)
+                except OSError as error:  # the model file is not found, training failed
+                    raise ValueError(
+                        f"Testing on client #{self.client_id} failed."
+                    ) from error
 
             self.pause_training()
         else:
@@ -427,13 +618,7 @@ class Trainer(base.Trainer):
             if model_training_time < requested_time:
                 model_path = f"{Config().params['model_path']}/{model_checkpoint}"
 
-                pretrained = None
-                if torch.cuda.is_available():
-                    pretrained = torch.load(model_path)
-                else:
-                    pretrained = torch.load(
-                        model_path, map_location=torch.device("cpu")
-                    )
+                pretrained = self.load_state_dict_file(model_path)
 
                 model = models_registry.get()
                 model.load_state_dict(pretrained, strict=True)
@@ -463,7 +648,13 @@ class Trainer(base.Trainer):
         sampler: the sampler for the trainloader to use.
         """
         return torch.utils.data.DataLoader(
-            dataset=trainset, shuffle=False, batch_size=batch_size, sampler=sampler
+            dataset=trainset,
+            shuffle=False,
+            batch_size=batch_size,
+            sampler=sampler,
+            pin_memory=self.uses_cuda,
+            num_workers=self.num_workers,
+            persistent_workers=self.num_workers > 0,
         )
 
     # pylint: disable=unused-argument
@@ -479,26 +670,33 @@ class Trainer(base.Trainer):
         batch_size = config["batch_size"]
 
         test_loader = torch.utils.data.DataLoader(
-            testset, batch_size=batch_size, shuffle=False, sampler=sampler
+            testset,
+            batch_size=batch_size,
+            shuffle=False,
+            sampler=sampler,
+            pin_memory=self.uses_cuda,
+            num_workers=self.num_workers,
         )
 
-        correct = 0
+        # The number of correct predictions is accumulated on the device, so that
+        # it is only copied back to the host once after all batches
+        correct = torch.zeros((), dtype=torch.long, device=self.device)
         total = 0
 
         self.model.to(self.device)
         with torch.no_grad():
             for examples, labels in test_loader:
-                examples, labels = examples.to(self.device), labels.to(self.device)
+                examples = examples.to(self.device, non_blocking=True)
+                labels = labels.to(self.device, non_blocking=True)
 
                 outputs = self.model(examples)
 
                 outputs = self.process_outputs(outputs)
 
-                _, predicted = torch.max(outputs.data, 1)
                 total += labels.size(0)
-                correct += (predicted == labels).sum().item()
+                correct += outputs.argmax(dim=1).eq(labels).sum()
 
-        return correct / total
+        return correct.item() / total
 
     def add_callbacks(self, callbacks):
         """Adds a list of callbacks to the trainer callback handler."""
@@ -530,9 +728,8 @@ class Trainer(base.Trainer):
         if "global_lr_scheduler" in config and config["global_lr_scheduler"]:
             global_lr_scheduler = copy.deepcopy(lr_scheduler)
 
-            for __ in range(self.current_round - 1):
-                for __ in range(Config().trainer.epochs):
-                    global_lr_scheduler.step()
+            for __ in range((self.current_round - 1) * config["epochs"]):
+                global_lr_scheduler.step()
 
             initial_lr = global_lr_scheduler.get_last_lr()
             optimizer.param_groups[0]["lr"] = initial_lr[0]
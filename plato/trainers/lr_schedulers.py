@@ -2,11 +2,11 @@
 Returns a learning rate scheduler according to the configuration.
 """
 import bisect
+import math
 import sys
 from types import SimpleNamespace
 from typing import Union
 
-import numpy as np
 from timm import scheduler
 from torch import optim
 
@@ -111,7 +111,7 @@ def get(
             returned_schedulers.append(
                 retrieved_scheduler(
                     optimizer,
-                    lambda it, lambdas=lambdas: np.product([l(it) for l in lambdas]),
+                    lambda it, lambdas=lambdas: math.prod(l(it) for l in lambdas),
                 )
             )
         elif _scheduler == "MultiStepLR":
@@ -1,7 +1,6 @@
 """
 A federated learning server with RL Agent.
 """
-import asyncio
 import logging
 from abc import abstractmethod
 
@@ -70,9 +69,6 @@ class RLServer(fedavg.Server):
                 else:
                     avg_update[name] += delta * self.smart_weighting[i]
 
-            # Yield to other tasks in the server
-            await asyncio.sleep(0)
-
         return avg_update
 
     async def update_action(self):
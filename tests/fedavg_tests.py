@@ -175,6 +175,66 @@ async def test_fedavg_aggregation(self):
     self.assertEqual(42.56, np.round(self.trainer.model(self.example).item(), 4))
 
 
+async def test_weighted_fedavg_aggregation(self):
+    """Testing federated averaging with unequal numbers of samples."""
+
+    print("\nTesting weighted federated averaging.")
+    trainer = basic.Trainer
+    algorithm = algorithms_registry.registered_algorithms[Config().algorithm.type]
+    server = fedavg_server.Server(
+        model=InnerProductModel, algorithm=algorithm, trainer=trainer
+    )
+    server.init_trainer()
+
+    baseline_weights = server.algorithm.extract_weights()
+    updates = []
+    deltas_received = []
+    for client_id, num_samples in enumerate([10, 30, 60], start=1):
+        torch.manual_seed(client_id)
+        deltas = {
+            name: torch.randn(weight.shape)
+            for name, weight in baseline_weights.items()
+        }
+        if client_id == 2:
+            # This client returns its deltas in a different key order
+            deltas = dict(reversed(list(deltas.items())))
+
+        updates.append(
+            simple.SimpleNamespace(
+                client_id=client_id,
+                report=simple.SimpleNamespace(
+                    client_id=client_id,
+                    num_samples=num_samples,
+                    accuracy=0,
+                    training_time=0,
+                    comm_time=0,
+                    update_response=False,
+                ),
+                payload=None,
+                staleness=0,
+            )
+        )
+        deltas_received.append(deltas)
+
+    # The weighted sum of the deltas, computed one parameter at a time
+    expected = {
+        name: sum(
+            deltas[name] * update.report.num_samples / 100
+            for update, deltas in zip(updates, deltas_received)
+        )
+        for name in baseline_weights
+    }
+
+    # Aggregating twice also reuses the flattened buffer of client deltas
+    for __ in range(2):
+        avg_update = await server.aggregate_deltas(updates, deltas_received)
+
+        self.assertEqual(list(baseline_weights), list(avg_update))
+        for name, delta in expected.items():
+            self.assertEqual(delta.shape, avg_update[name].shape)
+            self.assertTrue(torch.allclose(delta, avg_update[name], atol=1e-6))
+
+
 class FedAvgTest(unittest.TestCase):
     def setUp(self):
         super().setUp()
@@ -241,6 +301,9 @@ class FedAvgTest(unittest.TestCase):
     def test_fedavg_aggregation(self):
         asyncio.run(test_fedavg_aggregation(self))
 
+    def test_weighted_fedavg_aggregation(self):
+        asyncio.run(test_weighted_fedavg_aggregation(self))
+
 
 if __name__ == "__main__":
     unittest.main()
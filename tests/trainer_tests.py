@@ -0,0 +1,124 @@
+"""Unit tests for training and testing in spawned processes."""
+import os
+import unittest
+
+os.environ["config_file"] = "tests/TestsConfig/trainer_tests.yml"
+
+import torch
+
+from plato.config import Config
+from plato.trainers import basic
+
+
+class TinyModel(torch.nn.Module):
+    """A linear classifier small enough to be trained in a unit test."""
+
+    def __init__(self):
+        super().__init__()
+        self.layer = torch.nn.Linear(4, 2)
+
+    def forward(self, x):
+        return self.layer(x)
+
+
+class AllInclusiveSampler:
+    """A sampler that includes all the examples in a dataset."""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def get(self):
+        return torch.utils.data.SequentialSampler(self.dataset)
+
+
+class FileTrainer(basic.Trainer):
+    """A trainer whose spawned processes save their results to files."""
+
+    def train_process(self, config, trainset, sampler, **kwargs):
+        self.result_sender = None
+        super().train_process(config, trainset, sampler, **kwargs)
+
+    def test_process(self, config, testset, sampler=None, **kwargs):
+        self.result_sender = None
+        return super().test_process(config, testset, sampler, **kwargs)
+
+
+class FailingTrainer(basic.Trainer):
+    """A trainer whose spawned processes fail without sending any results."""
+
+    def train_model(self, config, trainset, sampler, **kwargs):
+        raise RuntimeError("Training failed.")
+
+
+class SpawnedTrainerTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        __ = Config()
+        self.assertTrue(hasattr(Config().trainer, "max_concurrency"))
+
+        torch.manual_seed(1)
+        self.dataset = torch.utils.data.TensorDataset(
+            torch.randn(16, 4), torch.randint(0, 2, (16,))
+        )
+        self.sampler = AllInclusiveSampler(self.dataset)
+
+    def expected_accuracy(self, model):
+        """Computes the accuracy of a model on the dataset in this process."""
+        examples, labels = self.dataset.tensors
+        with torch.no_grad():
+            predicted = model(examples).argmax(dim=1)
+
+        return predicted.eq(labels).sum().item() / len(labels)
+
+    def test_train(self):
+        """Test receiving the trained model from a spawned process."""
+        trainer = basic.Trainer(model=TinyModel)
+        weights = {
+            name: weight.clone() for name, weight in trainer.model.state_dict().items()
+        }
+
+        trainer.train(self.dataset, self.sampler)
+
+        for name, weight in trainer.model.state_dict().items():
+            self.assertFalse(torch.equal(weights[name], weight))
+        losses = trainer.run_history.get_metric_values("train_loss")
+        self.assertEqual(Config().trainer.epochs, len(losses))
+
+    def test_train_with_files(self):
+        """Test loading the trained model saved to a file by a spawned process."""
+        trainer = FileTrainer(model=TinyModel)
+        weights = {
+            name: weight.clone() for name, weight in trainer.model.state_dict().items()
+        }
+
+        trainer.train(self.dataset, self.sampler)
+
+        for name, weight in trainer.model.state_dict().items():
+            self.assertFalse(torch.equal(weights[name], weight))
+
+    def test_train_failure(self):
+        """Test that a spawned process exiting without a result fails training."""
+        trainer = FailingTrainer(model=TinyModel)
+
+        with self.assertRaises(ValueError):
+            trainer.train(self.dataset, self.sampler)
+
+    def test_test(self):
+        """Test receiving the accuracy from a spawned process."""
+        trainer = basic.Trainer(model=TinyModel)
+
+        accuracy = trainer.test(self.dataset)
+
+        self.assertAlmostEqual(self.expected_accuracy(trainer.model), accuracy)
+
+    def test_test_with_files(self):
+        """Test loading the accuracy saved to a file by a spawned process."""
+        trainer = FileTrainer(model=TinyModel)
+
+        accuracy = trainer.test(self.dataset)
+
+        self.assertAlmostEqual(self.expected_accuracy(trainer.model), accuracy)
+
+
+if __name__ == "__main__":
+    unittest.main()